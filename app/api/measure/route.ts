@@ -4,6 +4,11 @@ import path from "path"
 import fs from "fs"
 import { createClient } from "@/lib/supabase/server"
 
+// The Python process is killed after this long
+const PYTHON_TIMEOUT_MS = 30000
+// Cooperative deadline handed to Python so it returns partial results before being killed
+const PYTHON_DEADLINE_MS = PYTHON_TIMEOUT_MS - 5000
+
 export async function POST(request: NextRequest) {
   console.log("🚀 API /measure called")
 
@@ -15,6 +20,7 @@ export async function POST(request: NextRequest) {
     const referenceObject = formData.get("referenceObject") as string
     const customWidth = formData.get("customWidth") as string
     const customHeight = formData.get("customHeight") as string
+    const latencyBudgetMs = formData.get("latencyBudgetMs") as string | null
 
     console.log("📝 Request data:", {
       hasImage: !!image,
@@ -64,6 +70,8 @@ export async function POST(request: NextRequest) {
       referenceObject: referenceObject,
       customWidth: customWidth ? Number.parseFloat(customWidth) : null,
       customHeight: customHeight ? Number.parseFloat(customHeight) : null,
+      latencyBudgetMs: latencyBudgetMs ? Number.parseFloat(latencyBudgetMs) : null,
+      deadlineMs: PYTHON_DEADLINE_MS,
     }
 
     // Step 4: Process with Python or fallback
@@ -81,7 +89,11 @@ export async function POST(request: NextRequest) {
 
     // Step 5: Validate result
     console.log("🔄 Step 5: Validating result...")
-    if (!result || typeof result !== "object" || !result.success) {
+    if (result && typeof result === "object" && !result.success && result.partial) {
+      // Deadline hit before measurement finished: return what was computed
+      // (e.g. calibrationInfo) instead of replacing it with mock data
+      console.warn("⚠️ Partial result after deadline:", result.error)
+    } else if (!result || typeof result !== "object" || !result.success) {
       console.error("❌ Invalid result from processing:", result)
       result = getFallbackResult(inputData, base64Image)
     }
@@ -349,7 +361,7 @@ function executePythonScript(inputData: string): Promise<any> {
           pythonProcess.kill()
           currentCommandIndex++
           tryNextPythonCommand()
-        }, 30000)
+        }, PYTHON_TIMEOUT_MS)
       }
 
       tryNextPythonCommand()
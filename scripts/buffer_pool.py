@@ -0,0 +1,97 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def resident_memory_bytes():
+    """Current resident set size, or None if it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_resident_memory_bytes():
+    """Peak resident set size, or None if it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class BufferPool:
+    """Per-worker pool of reusable image arrays and OpenCV helper objects
+
+    Arrays are keyed by (name, shape, dtype) and grouped by image shape;
+    only the max_shapes most recently used shapes are kept, so a worker
+    that sees a handful of camera resolutions reuses the same memory on
+    every request. Returned arrays are overwritten by the next request
+    with the same shape, so callers must not hold on to them. Not thread
+    safe: give each worker thread or process its own pool.
+    """
+
+    def __init__(self, max_shapes=4):
+        self.max_shapes = max_shapes
+        self.shapes = OrderedDict()
+        self.clahe_objects = {}
+        self.kernels = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, shape, dtype=np.uint8, group=None):
+        """Return a pooled array for this name and shape (contents are undefined)
+
+        group is the image shape the buffer belongs to, used for eviction;
+        it defaults to shape itself.
+        """
+        group = tuple(group or shape)
+        buffers = self.shapes.get(group)
+        if buffers is None:
+            buffers = self.shapes[group] = {}
+            while len(self.shapes) > self.max_shapes:
+                self.shapes.popitem(last=False)
+        self.shapes.move_to_end(group)
+
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        array = buffers.get(key)
+        if array is None:
+            self.misses += 1
+            array = buffers[key] = np.empty(shape, dtype=dtype)
+        else:
+            self.hits += 1
+        return array
+
+    def clahe(self, cv2, clip_limit=2.0, tile_grid_size=(8, 8)):
+        """Return a cached CLAHE object"""
+        key = (clip_limit, tuple(tile_grid_size))
+        if key not in self.clahe_objects:
+            self.clahe_objects[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        return self.clahe_objects[key]
+
+    def kernel(self, cv2, shape, size):
+        """Return a cached structuring element"""
+        key = (shape, tuple(size))
+        if key not in self.kernels:
+            self.kernels[key] = cv2.getStructuringElement(shape, size)
+        return self.kernels[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        pooled_bytes = sum(a.nbytes for buffers in self.shapes.values() for a in buffers.values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "shapes": len(self.shapes),
+            "pooled_bytes": pooled_bytes,
+            "rss_bytes": resident_memory_bytes(),
+            "peak_rss_bytes": peak_resident_memory_bytes()
+        }
@@ -0,0 +1,41 @@
+import time
+
+
+class Deadline:
+    """Cooperative request deadline checked between and inside pipeline stages
+
+    check(stage) returns True once the deadline has passed and records the
+    stage that was skipped or cut short, so the pipeline can return what it
+    has computed so far flagged as partial.
+    """
+
+    def __init__(self, budget_ms=None):
+        self.budget_ms = budget_ms
+        self.expires_at = None if budget_ms is None else time.monotonic() + budget_ms / 1000
+        self.interrupted_stages = []
+
+    def remaining_ms(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, (self.expires_at - time.monotonic()) * 1000)
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self, stage):
+        """Return True if the deadline has passed, recording the stage"""
+        if not self.expired():
+            return False
+        if stage not in self.interrupted_stages:
+            self.interrupted_stages.append(stage)
+        return True
+
+    @property
+    def hit(self):
+        return bool(self.interrupted_stages)
+
+    def report(self):
+        return {
+            "budgetMs": self.budget_ms,
+            "interruptedStages": self.interrupted_stages
+        }
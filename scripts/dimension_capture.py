@@ -8,6 +8,14 @@ import math
 from PIL import Image
 import io
 import os
+import time
+from contextlib import contextmanager
+from latency_policy import LatencyPolicy
+from request_profiler import RequestProfiler, null_stage, parse_cli_args
+from stage_cache import StageCache, content_hash
+from buffer_pool import BufferPool
+from deadline import Deadline
+from numpy_detector import refine_box
 # Set OpenCV to headless mode before importing cv2
 os.environ['OPENCV_IO_MAX_IMAGE_PIXELS'] = str(2**64)
 # Disable GUI backend for OpenCV
@@ -26,12 +34,25 @@ except ImportError as e:
     print("Falling back to simple mode", file=sys.stderr)
     cv2 = None
 
+# Canny plus the close (2 iterations) and dilation in preprocess_image grow
+# outlines by about this many analysis pixels on every side
+EDGE_GROWTH_PX = 1.5
+
 class DimensionCapture:
     def __init__(self):
         # Reference object dimensions (Debit Card)
         self.DEBIT_CARD_WIDTH_CM = 8.56
         self.DEBIT_CARD_HEIGHT_CM = 5.398
 
+        # Stage hook, replaced by RequestProfiler.stage when profiling
+        self.stage = null_stage
+
+        # Hash of the last decoded input, for profile reports
+        self.input_hash = None
+
+        # Reused hot-loop arrays, CLAHE and kernels for long-running workers
+        self.buffer_pool = BufferPool()
+
         # Check if we can use full OpenCV functionality
         if cv2 is None:
             print("OpenCV not available, using fallback mode", file=sys.stderr)
@@ -52,38 +73,67 @@ class DimensionCapture:
             'card': None,  # We'll detect rectangles for cards
         }
 
-    def preprocess_image(self, image):
-        """Preprocess image for better contour detection"""
+        # Chooses detector size / analysis resolution from a latency budget
+        self.latency_policy = LatencyPolicy()
+
+        # Detector output and rectangle candidates keyed by image content
+        self.stage_cache = StageCache()
+
+    @contextmanager
+    def timed_stage(self, name, timings):
+        """Run self.stage(name) and add its wall time in ms to timings[name]"""
+        start = time.perf_counter()
+        with self.stage(name):
+            yield
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def preprocess_image(self, image, edge_strategy="multi_canny"):
+        """Preprocess image for better contour detection
+
+        Intermediate arrays come from the buffer pool, so the returned edge
+        map is only valid until the next call with the same image shape.
+        """
+        pool = self.buffer_pool
+        shape = image.shape[:2]
+
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=pool.get("gray", shape))
 
         # Apply adaptive histogram equalization for better contrast
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
+        clahe = pool.clahe(cv2, 2.0, (8, 8))
+        enhanced = clahe.apply(gray, dst=pool.get("enhanced", shape))
 
-        # Apply multiple edge detection approaches
-        edges1 = cv2.Canny(enhanced, 30, 100)
-        edges2 = cv2.Canny(enhanced, 50, 150)
-        edges3 = cv2.Canny(enhanced, 100, 200)
+        if edge_strategy == "single_canny":
+            # Cheaper tiers use only the middle threshold pair
+            edges = cv2.Canny(enhanced, 50, 150, edges=pool.get("edges", shape))
+        else:
+            # Apply multiple edge detection approaches
+            edges1 = cv2.Canny(enhanced, 30, 100, edges=pool.get("edges1", shape))
+            edges2 = cv2.Canny(enhanced, 50, 150, edges=pool.get("edges2", shape))
+            edges3 = cv2.Canny(enhanced, 100, 200, edges=pool.get("edges3", shape))
 
-        # Combine edge detections
-        edges = cv2.bitwise_or(edges1, cv2.bitwise_or(edges2, edges3))
+            # Combine edge detections
+            edges = cv2.bitwise_or(edges2, edges3, dst=pool.get("edges", shape))
+            cv2.bitwise_or(edges1, edges, dst=edges)
 
         # Apply morphological operations
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, iterations=2)
-        edges = cv2.dilate(edges, kernel, iterations=1)
+        kernel = pool.kernel(cv2, cv2.MORPH_RECT, (3, 3))
+        closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, kernel, dst=pool.get("closed", shape), iterations=2)
+        edges = cv2.dilate(closed, kernel, dst=pool.get("dilated", shape), iterations=1)
 
         return edges
 
-    def find_rectangles(self, edges):
+    def find_rectangles(self, edges, min_area=500, min_distance=50, deadline=None):
         """Find rectangular contours in the image"""
         contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
         rectangles = []
         for contour in contours:
+            if deadline and deadline.check("find_rectangles"):
+                break  # Keep the rectangles found so far
+
             area = cv2.contourArea(contour)
-            if area < 500:  # Skip very small contours
+            if area < min_area:  # Skip very small contours
                 continue
 
             # Try different epsilon values for approximation
@@ -121,7 +171,7 @@ class DimensionCapture:
                 # Check if centers are close
                 dist = math.sqrt((rect['center'][0] - existing['center'][0])**2 +
                                (rect['center'][1] - existing['center'][1])**2)
-                if dist < 50:  # Too close, likely same object
+                if dist < min_distance:  # Too close, likely same object
                     # Keep the more rectangular one
                     if rect['rectangularity'] > existing['rectangularity']:
                         filtered_rectangles.remove(existing)
@@ -133,6 +183,47 @@ class DimensionCapture:
 
         return filtered_rectangles
 
+    def rescale_rectangles(self, rectangles, factor, margin=0.0):
+        """Map rectangles found on a downscaled image back to full resolution
+
+        margin (in analysis pixels) is removed from every side first, so
+        outline growth is not multiplied by factor.
+        """
+        scaled = []
+        for rect in rectangles:
+            x, y, w, h = rect['bbox']
+            inset = min(margin, (min(w, h) - 1) / 2)
+            x, y, w, h = x + inset, y + inset, w - 2 * inset, h - 2 * inset
+            x, y, w, h = int(round(x * factor)), int(round(y * factor)), int(round(w * factor)), int(round(h * factor))
+            scaled.append(dict(
+                rect,
+                contour=(rect['contour'] * factor).astype(np.int32),
+                bbox=(x, y, w, h),
+                area=rect['area'] * factor * factor,
+                center=(x + w//2, y + h//2)
+            ))
+        return scaled
+
+    def refine_rectangles(self, image, rectangles, factor, min_rectangularity=0.85):
+        """Snap box sides to the strongest full-resolution edge nearby
+
+        Boxes from a downscaled analysis image are only accurate to about
+        one analysis pixel; this searches a couple of analysis pixels
+        around each side (see numpy_detector.refine_box). Boxes that fill
+        less of their bounding rectangle (e.g. rotated objects) have no
+        straight side to snap to and are left alone.
+        """
+        radius = int(math.ceil(2 * factor)) + 1
+        smoothing = max(1, int(factor // 2))
+        refined = []
+        for rect in rectangles:
+            if rect['rectangularity'] < min_rectangularity:
+                refined.append(rect)
+                continue
+            x, y, w, h = refine_box(image, rect['bbox'], radius, smoothing)
+            refined.append(dict(rect, bbox=(x, y, w, h), aspect_ratio=w / h if h > 0 else 0, center=(x + w//2, y + h//2)))
+        return refined
+
     def classify_rectangles(self, rectangles, yolo_detections, reference_type="credit-card"):
         """Classify rectangles as reference object or target objects"""
         reference_object = None
@@ -209,9 +300,12 @@ class DimensionCapture:
 
         return reference_object, target_objects
 
-    def detect_objects_yolo(self, image):
+    def detect_objects_yolo(self, image, imgsz=None):
         """Use YOLO to detect objects"""
-        results = self.model(image, conf=0.3)
+        if imgsz:
+            results = self.model(image, conf=0.3, imgsz=imgsz)
+        else:
+            results = self.model(image, conf=0.3)
         detections = []
 
         for result in results:
@@ -237,6 +331,22 @@ class DimensionCapture:
 
         return detections
 
+    def calibrate(self, reference_object, ref_width_cm, ref_height_cm):
+        """Return (pixels_per_cm, calibration_info) for the reference object"""
+        ref_width_px = reference_object['bbox'][2]
+        ref_height_px = reference_object['bbox'][3]
+
+        pixels_per_cm_width = ref_width_px / ref_width_cm
+        pixels_per_cm_height = ref_height_px / ref_height_cm
+        pixels_per_cm = (pixels_per_cm_width + pixels_per_cm_height) / 2
+
+        calibration_info = {
+            'pixels_per_cm': round(pixels_per_cm, 2),
+            'ref_width_px': ref_width_px,
+            'ref_height_px': ref_height_px
+        }
+        return pixels_per_cm, calibration_info
+
     def calculate_dimensions(self, reference_object, target_objects, ref_width_cm, ref_height_cm):
         """Calculate dimensions using reference object"""
         if reference_object is None:
@@ -246,12 +356,7 @@ class DimensionCapture:
             return None, "No target objects detected!"
 
         # Calculate pixels per cm using reference object
-        ref_width_px = reference_object['bbox'][2]
-        ref_height_px = reference_object['bbox'][3]
-
-        pixels_per_cm_width = ref_width_px / ref_width_cm
-        pixels_per_cm_height = ref_height_px / ref_height_cm
-        pixels_per_cm = (pixels_per_cm_width + pixels_per_cm_height) / 2
+        pixels_per_cm, calibration_info = self.calibrate(reference_object, ref_width_cm, ref_height_cm)
 
         results = []
         for i, obj in enumerate(target_objects):
@@ -270,17 +375,13 @@ class DimensionCapture:
                 'bbox': obj['bbox']
             })
 
-        calibration_info = {
-            'pixels_per_cm': round(pixels_per_cm, 2),
-            'ref_width_px': ref_width_px,
-            'ref_height_px': ref_height_px
-        }
-
         return results, calibration_info
 
     def annotate_image(self, image, reference_object, target_objects, results, calibration_info, ref_name, ref_width_cm, ref_height_cm):
         """Annotate image with detection results"""
-        annotated = image.copy()
+        # Pooled copy, only valid until the next call with the same shape
+        annotated = self.buffer_pool.get("annotated", image.shape, group=image.shape[:2])
+        np.copyto(annotated, image)
 
         MAIN_TEXT_SCALE = 1.2
         DIMENSION_TEXT_SCALE = 1.0
@@ -312,8 +413,10 @@ class DimensionCapture:
 
         return annotated
 
-    def process_image_from_base64(self, base64_image, reference_type="credit-card", custom_width=None, custom_height=None):
+    def process_image_from_base64(self, base64_image, reference_type="credit-card", custom_width=None, custom_height=None, latency_budget_ms=None, on_measurements=None, deadline=None):
         """Process image from base64 string"""
+        start = time.perf_counter()
+        self.input_hash = None
     
         # Use fallback if OpenCV is not available
         if cv2 is None or self.model is None:
@@ -322,13 +425,51 @@ class DimensionCapture:
     
         try:
             # Decode base64 image
-            image_data = base64.b64decode(base64_image)
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            with self.stage("decode"):
+                image_data = base64.b64decode(base64_image)
+                self.input_hash = content_hash(image_data)
+                nparr = np.frombuffer(image_data, np.uint8)
+                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
             
             if image is None:
                 return {"success": False, "error": "Could not decode image"}
 
+        except Exception as e:
+            return {"success": False, "error": f"Processing error: {str(e)}"}
+
+        if latency_budget_ms is not None:
+            # Decoding already used part of the budget
+            latency_budget_ms -= (time.perf_counter() - start) * 1000
+
+        # Hashing the encoded bytes is much cheaper than hashing pixels
+        return self.process_frame(image, reference_type, custom_width, custom_height,
+                                  latency_budget_ms=latency_budget_ms, on_measurements=on_measurements,
+                                  cache_key=self.input_hash, deadline=deadline)
+
+    def process_frame(self, image, reference_type="credit-card", custom_width=None, custom_height=None, annotate=True, latency_budget_ms=None, on_measurements=None, cache_key=None, deadline=None):
+        """Process an already decoded BGR frame (e.g. a shared-memory view)
+
+        The frame is only read, never written, so it may be a view onto a
+        buffer owned by another process. With annotate=False the annotated
+        image is skipped and only the measurement JSON is returned.
+        latency_budget_ms selects the processing tier (see latency_policy).
+        on_measurements, if given, is called with the measurement data as
+        soon as it is known, before the annotated image is produced.
+        When cache_key identifies the image (e.g. a hash of its encoded
+        bytes), detections and rectangle candidates are reused from the
+        stage cache when it is processed again at the same tier. Without a
+        key nothing is cached: hashing every pixel of a live frame costs
+        more than a hit saves, and live frames rarely repeat.
+        When the Deadline passes, remaining expensive stages are skipped and
+        whatever was measured so far is returned with data.partial set.
+        """
+        deadline = deadline or Deadline()
+        timings = {}
+        try:
+            start = time.perf_counter()
+            img_height, img_width = image.shape[:2]
+            tier, estimated_ms = self.latency_policy.select(latency_budget_ms, img_width, img_height, annotate)
+
             # Get reference dimensions
             reference_objects = {
                 "credit-card": {"name": "Credit Card", "width": 8.56, "height": 5.398},
@@ -344,52 +485,132 @@ class DimensionCapture:
             ref_width_cm = ref_info["width"]
             ref_height_cm = ref_info["height"]
 
-            # Process image
-            yolo_detections = self.detect_objects_yolo(image)
-            edges = self.preprocess_image(image)
-            rectangles = self.find_rectangles(edges)
-            reference_object, target_objects = self.classify_rectangles(rectangles, yolo_detections, reference_type)
+            # Candidates depend on the image and tier, not on the reference
+            stage_key = None if cache_key is None else f"{cache_key}-{tier['name']}"
+            cached = self.stage_cache.get(stage_key) if stage_key else None
+
+            if cached:
+                yolo_detections, rectangles = cached
+                print("♻️ Reusing cached detections and rectangles", file=sys.stderr)
+            else:
+                # Contour stages run on a downscaled copy for cheaper tiers
+                scale = 1.0
+                analysis_image = image
+                if tier["analysis_max_side"]:
+                    scale = min(1.0, tier["analysis_max_side"] / max(img_width, img_height))
+                if scale < 1.0:
+                    analysis_size = (max(1, round(img_width * scale)), max(1, round(img_height * scale)))
+                    with self.timed_stage("downscale", timings):
+                        analysis_image = cv2.resize(
+                            image, analysis_size, interpolation=cv2.INTER_AREA,
+                            dst=self.buffer_pool.get("analysis", (analysis_size[1], analysis_size[0], 3), group=image.shape[:2])
+                        )
+
+                # Process image. Rectangles come first: calibration needs
+                # them, while YOLO detections only refine classification.
+                rectangles = []
+                if not deadline.check("preprocess_image"):
+                    with self.timed_stage("preprocess_image", timings):
+                        edges = self.preprocess_image(analysis_image, tier["edge_strategy"])
+                    with self.timed_stage("find_rectangles", timings):
+                        rectangles = self.find_rectangles(
+                            edges, min_area=500 * scale * scale, min_distance=50 * scale, deadline=deadline
+                        )
+                        rectangles = self.rescale_rectangles(rectangles, 1.0 / scale, EDGE_GROWTH_PX)
+                        rectangles = self.refine_rectangles(image, rectangles, 1.0 / scale)
+
+                yolo_detections = []
+                if not deadline.check("detect_objects_yolo"):
+                    with self.timed_stage("detect_objects_yolo", timings):
+                        yolo_detections = self.detect_objects_yolo(image, tier["detector_imgsz"])
+
+                # Never cache stages that were cut short
+                if stage_key and not deadline.hit:
+                    self.stage_cache.put(stage_key, (yolo_detections, rectangles))
+
+            with self.stage("classify_rectangles"):
+                reference_object, target_objects = self.classify_rectangles(rectangles, yolo_detections, reference_type)
             
-            results, calibration_info = self.calculate_dimensions(
-                reference_object, target_objects, ref_width_cm, ref_height_cm
-            )
+            with self.stage("calculate_dimensions"):
+                results, calibration_info = self.calculate_dimensions(
+                    reference_object, target_objects, ref_width_cm, ref_height_cm
+                )
 
             if isinstance(calibration_info, str):  # Error message
+                if deadline.hit:
+                    partial_result = {
+                        "success": False,
+                        "error": f"Deadline exceeded: {calibration_info}",
+                        "partial": True,
+                        "deadline": deadline.report()
+                    }
+                    if reference_object is not None:
+                        # Calibration alone is still useful to the caller
+                        _, partial_result["calibrationInfo"] = self.calibrate(reference_object, ref_width_cm, ref_height_cm)
+                    return partial_result
                 return {"success": False, "error": calibration_info}
 
-            # Create annotated image
-            annotated_image = self.annotate_image(
-                image, reference_object, target_objects, results, 
-                calibration_info, ref_name, ref_width_cm, ref_height_cm
-            )
-
-            # Convert annotated image back to base64
-            _, buffer = cv2.imencode('.jpg', annotated_image)
-            annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+            if not results:
+                return {"success": False, "error": "No objects could be measured"}
 
             # Calculate confidence based on detection quality
             confidence = 0.9 if reference_object and results else 0.5
 
             # Format results for web API
-            if results and len(results) > 0:
-                # Return the first/largest object's dimensions
-                main_result = max(results, key=lambda x: x['width_cm'] * x['height_cm'])
-                return {
-                    "success": True,
-                    "data": {
-                        "targetDimensions": {
-                            "width": main_result["width_cm"],
-                            "height": main_result["height_cm"],
-                            "unit": "cm"
-                        },
-                        "confidence": confidence,
-                        "annotatedImageUrl": f"data:image/jpeg;base64,{annotated_base64}",
-                        "allObjects": results,
-                        "calibrationInfo": calibration_info
-                    }
-                }
-            else:
-                return {"success": False, "error": "No objects could be measured"}
+            # Return the first/largest object's dimensions
+            main_result = max(results, key=lambda x: x['width_cm'] * x['height_cm'])
+            data = {
+                "targetDimensions": {
+                    "width": main_result["width_cm"],
+                    "height": main_result["height_cm"],
+                    "unit": "cm"
+                },
+                "confidence": confidence,
+                "allObjects": results,
+                "calibrationInfo": calibration_info
+            }
+
+            if on_measurements:
+                on_measurements(dict(data))
+
+            if annotate and not deadline.check("annotate_image"):
+                # Create annotated image
+                with self.timed_stage("annotate_image", timings):
+                    annotated_image = self.annotate_image(
+                        image, reference_object, target_objects, results, 
+                        calibration_info, ref_name, ref_width_cm, ref_height_cm
+                    )
+
+                # Convert annotated image back to base64
+                with self.timed_stage("encode", timings):
+                    _, buffer = cv2.imencode('.jpg', annotated_image)
+                    annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+
+                data["annotatedImageUrl"] = f"data:image/jpeg;base64,{annotated_base64}"
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if not deadline.hit:
+                # Only stages that actually ran are recorded, so cache hits
+                # and skipped annotation leave the other costs untouched
+                self.latency_policy.record(tier, timings, img_width, img_height)
+
+            data["processingTier"] = {
+                "name": tier["name"],
+                "detectorImageSize": tier["detector_imgsz"],
+                "analysisMaxSide": tier["analysis_max_side"],
+                "edgeStrategy": tier["edge_strategy"],
+                "latencyBudgetMs": round(latency_budget_ms, 1) if latency_budget_ms is not None else None,
+                "estimatedMs": round(estimated_ms, 1),
+                "elapsedMs": round(elapsed_ms, 1),
+                "stageMs": {name: round(ms, 1) for name, ms in timings.items()}
+            }
+            data["stageCache"] = dict(self.stage_cache.stats(), hit=bool(cached))
+            data["bufferPool"] = self.buffer_pool.stats()
+            if deadline.hit:
+                data["partial"] = True
+                data["deadline"] = deadline.report()
+
+            return {"success": True, "data": data}
 
         except Exception as e:
             return {"success": False, "error": f"Processing error: {str(e)}"}
@@ -399,6 +620,7 @@ class DimensionCapture:
         try:
             # Use PIL for basic image processing
             image_data = base64.b64decode(base64_image)
+            self.input_hash = content_hash(image_data)
             image = Image.open(io.BytesIO(image_data))
         
             # Get image dimensions
@@ -460,24 +682,75 @@ class DimensionCapture:
             return {"success": False, "error": f"Fallback processing error: {str(e)}"}
 
 def main():
-    if len(sys.argv) < 2:
+    payload, flags = parse_cli_args(sys.argv)
+    if payload is None:
         print(json.dumps({"success": False, "error": "No image data provided"}))
         return
 
     try:
         # Parse input arguments
-        input_data = json.loads(sys.argv[1])
+        input_data = json.loads(payload)
         base64_image = input_data.get("image")
         reference_type = input_data.get("referenceObject", "credit-card")
         custom_width = input_data.get("customWidth")
         custom_height = input_data.get("customHeight")
+        latency_budget_ms = input_data.get("latencyBudgetMs")
+        deadline_ms = input_data.get("deadlineMs")
+        profile = "profile" in flags or bool(input_data.get("profile"))
+        stream = "stream" in flags or bool(input_data.get("stream"))
+
+        # Started before model loading so it covers the whole request
+        deadline = Deadline(deadline_ms) if deadline_ms else None
 
         # Initialize dimension capture
         dc = DimensionCapture()
-        
+
+        profiler = None
+        if profile:
+            profiler = RequestProfiler(input_data.get("profileDir", "profiles"))
+            dc.stage = profiler.stage
+            profiler.start()
+
+        # In stream mode the measurements are written as a first JSON line
+        # while the annotated image is still being rendered
+        streamed = []
+
+        def emit_measurements(data):
+            print(json.dumps({"success": True, "phase": "measurements", "data": data}), flush=True)
+            streamed.append(set(data))
+
         # Process image
-        result = dc.process_image_from_base64(base64_image, reference_type, custom_width, custom_height)
+        try:
+            result = dc.process_image_from_base64(
+                base64_image, reference_type, custom_width, custom_height, latency_budget_ms,
+                on_measurements=emit_measurements if stream else None,
+                deadline=deadline
+            )
+        finally:
+            if profiler:
+                profiler.stop()
+            # One-shot invocations persist what this request measured
+            if getattr(dc, "latency_policy", None):
+                dc.latency_policy.save()
+
+        if profiler:
+            result["profile"] = profiler.write({
+                "referenceObject": reference_type,
+                "customWidth": custom_width,
+                "customHeight": custom_height,
+                "imageBytes": len(base64_image or "") * 3 // 4,
+                "imageHash": dc.input_hash
+            }, payload if "profile-save-input" in flags or input_data.get("profileSaveInput") else None)
         
+        if stream and result.get("success"):
+            if not streamed:
+                # Fallback mode has no separate measurement phase
+                emit_measurements({k: v for k, v in result["data"].items() if k != "annotatedImageUrl"})
+            result["phase"] = "annotated_image"
+            result["data"] = {k: v for k, v in result["data"].items() if k not in streamed[0]}
+        elif stream:
+            result["phase"] = "error"
+
         # Output result as JSON
         print(json.dumps(result))
 
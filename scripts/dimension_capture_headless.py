@@ -5,6 +5,9 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import io
 import math
+from request_profiler import RequestProfiler, null_stage, parse_cli_args
+from stage_cache import content_hash
+from numpy_detector import detect_rectangles, measure_rectangles, detection_confidence
 
 class HeadlessDimensionCapture:
     def __init__(self):
@@ -18,38 +21,19 @@ class HeadlessDimensionCapture:
             "custom": {"name": "Custom Reference", "width": 0, "height": 0}
         }
 
-    def create_annotated_image(self, image, ref_info, target_dims):
-        """Create a simple annotated image using PIL"""
+        # Stage hook, replaced by RequestProfiler.stage when profiling
+        self.stage = null_stage
+
+        # Hash of the last decoded input, for profile reports
+        self.input_hash = None
+
+    def create_annotated_image(self, image, ref_info, reference, results):
+        """Draw the detected reference and target boxes using PIL"""
         try:
             # Create a copy of the image
             annotated = image.copy()
             draw = ImageDraw.Draw(annotated)
             
-            # Get image dimensions
-            img_width, img_height = image.size
-            
-            # Calculate mock positions for reference and target objects
-            # Reference object (top-left area)
-            ref_x = img_width // 10
-            ref_y = img_height // 10
-            ref_w = img_width // 8
-            ref_h = int(ref_w * (ref_info["height"] / ref_info["width"]))
-            
-            # Target object (center area)
-            target_x = img_width // 3
-            target_y = img_height // 3
-            target_w = img_width // 4
-            target_h = int(target_w * 0.7)
-            
-            # Draw rectangles
-            # Reference object in green
-            draw.rectangle([ref_x, ref_y, ref_x + ref_w, ref_y + ref_h], 
-                         outline="green", width=3)
-            
-            # Target object in red
-            draw.rectangle([target_x, target_y, target_x + target_w, target_y + target_h], 
-                         outline="red", width=3)
-            
             # Add text labels (simplified)
             try:
                 # Try to use default font
@@ -57,15 +41,19 @@ class HeadlessDimensionCapture:
             except:
                 font = None
             
-            # Reference label
-            ref_text = f"{ref_info['name']} (Ref)"
+            # Reference object in green
+            x, y, w, h = reference["bbox"]
+            draw.rectangle([x, y, x + w, y + h], outline="green", width=3)
             if font:
-                draw.text((ref_x, ref_y - 20), ref_text, fill="green", font=font)
+                draw.text((x, y - 20), f"{ref_info['name']} (Ref)", fill="green", font=font)
             
-            # Target label
-            target_text = f"Object: {target_dims['width']}x{target_dims['height']} cm"
-            if font:
-                draw.text((target_x, target_y - 20), target_text, fill="red", font=font)
+            # Target objects in red
+            for result in results:
+                x, y, w, h = result["bbox"]
+                draw.rectangle([x, y, x + w, y + h], outline="red", width=3)
+                if font:
+                    draw.text((x, y - 20), f"Object {result['object_id']}: {result['width_cm']}x{result['height_cm']} cm",
+                              fill="red", font=font)
             
             return annotated
             
@@ -75,14 +63,17 @@ class HeadlessDimensionCapture:
 
     def process_image_from_base64(self, base64_image, reference_type="credit-card", custom_width=None, custom_height=None):
         """Process image using only PIL - no OpenCV required"""
+        self.input_hash = None
         try:
             # Decode base64 image
-            image_data = base64.b64decode(base64_image)
-            image = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            with self.stage("decode"):
+                image_data = base64.b64decode(base64_image)
+                self.input_hash = content_hash(image_data)
+                image = Image.open(io.BytesIO(image_data))
+                
+                # Convert to RGB if necessary
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
             
             # Get image dimensions
             img_width, img_height = image.size
@@ -94,44 +85,39 @@ class HeadlessDimensionCapture:
                 ref_info["width"] = custom_width or 8.56
                 ref_info["height"] = custom_height or 5.398
             
-            # Simulate object detection with reasonable assumptions
-            # Reference object: assume it's about 1/8 of image width
-            ref_width_px = max(img_width // 8, 50)  # Minimum 50 pixels
-            ref_height_px = int(ref_width_px * (ref_info["height"] / ref_info["width"]))
-            
-            # Target object: assume it's larger, about 1/4 of image width
-            target_width_px = max(img_width // 4, 100)  # Minimum 100 pixels
-            
-            # Vary target height based on image aspect ratio for more realism
-            if img_width > img_height:  # Landscape
-                target_height_px = int(target_width_px * 0.6)
-            else:  # Portrait or square
-                target_height_px = int(target_width_px * 0.8)
+            # Detect rectangles on a downscaled grayscale copy (NumPy only)
+            with self.stage("detect_rectangles"):
+                rectangles = detect_rectangles(image)
             
-            # Calculate pixels per cm using reference object
-            pixels_per_cm = ref_width_px / ref_info["width"]
+            with self.stage("calculate_dimensions"):
+                reference, targets, results, calibration_info = measure_rectangles(
+                    rectangles, ref_info["width"], ref_info["height"]
+                )
             
-            # Calculate target dimensions in cm
-            target_width_cm = target_width_px / pixels_per_cm
-            target_height_cm = target_height_px / pixels_per_cm
+            if reference is None:
+                print(f"Detection failed: {calibration_info}", file=sys.stderr)
+                return {"success": False, "error": calibration_info}
             
-            # Create target dimensions object
+            # Return the largest object's dimensions
+            main_result = max(results, key=lambda x: x["width_cm"] * x["height_cm"])
             target_dims = {
-                "width": round(target_width_cm, 2),
-                "height": round(target_height_cm, 2),
+                "width": main_result["width_cm"],
+                "height": main_result["height_cm"],
                 "unit": "cm"
             }
             
             # Create annotated image
-            annotated_image = self.create_annotated_image(image, ref_info, target_dims)
+            with self.stage("annotate_image"):
+                annotated_image = self.create_annotated_image(image, ref_info, reference, results)
             
             # Convert annotated image back to base64
-            buffer = io.BytesIO()
-            annotated_image.save(buffer, format='JPEG', quality=85)
-            annotated_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            with self.stage("encode"):
+                buffer = io.BytesIO()
+                annotated_image.save(buffer, format='JPEG', quality=85)
+                annotated_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
             
-            # Calculate confidence based on image quality and size
-            confidence = min(0.85, 0.5 + (min(img_width, img_height) / 2000))  # Higher confidence for larger images
+            # Calculate confidence based on how well the reference matched
+            confidence = detection_confidence(reference, ref_info["width"], ref_info["height"])
             
             print(f"Processed successfully: {target_dims['width']}x{target_dims['height']} cm", file=sys.stderr)
             
@@ -141,18 +127,8 @@ class HeadlessDimensionCapture:
                     "targetDimensions": target_dims,
                     "confidence": confidence,
                     "annotatedImageUrl": f"data:image/jpeg;base64,{annotated_base64}",
-                    "allObjects": [{
-                        "object_id": 1,
-                        "width_cm": target_dims["width"],
-                        "height_cm": target_dims["height"],
-                        "width_px": target_width_px,
-                        "height_px": target_height_px
-                    }],
-                    "calibrationInfo": {
-                        "pixels_per_cm": round(pixels_per_cm, 2),
-                        "ref_width_px": ref_width_px,
-                        "ref_height_px": ref_height_px
-                    }
+                    "allObjects": results,
+                    "calibrationInfo": calibration_info
                 }
             }
             
@@ -162,12 +138,13 @@ class HeadlessDimensionCapture:
 
 def main():
     try:
-        if len(sys.argv) < 2:
+        payload, flags = parse_cli_args(sys.argv)
+        if payload is None:
             print(json.dumps({"success": False, "error": "No input data provided"}))
             return
         
         # Parse input
-        input_data = json.loads(sys.argv[1])
+        input_data = json.loads(payload)
         base64_image = input_data.get("image")
         reference_type = input_data.get("referenceObject", "credit-card")
         custom_width = input_data.get("customWidth")
@@ -179,7 +156,27 @@ def main():
         
         # Process image
         processor = HeadlessDimensionCapture()
-        result = processor.process_image_from_base64(base64_image, reference_type, custom_width, custom_height)
+
+        profiler = None
+        if "profile" in flags or input_data.get("profile"):
+            profiler = RequestProfiler(input_data.get("profileDir", "profiles"))
+            processor.stage = profiler.stage
+            profiler.start()
+
+        try:
+            result = processor.process_image_from_base64(base64_image, reference_type, custom_width, custom_height)
+        finally:
+            if profiler:
+                profiler.stop()
+
+        if profiler:
+            result["profile"] = profiler.write({
+                "referenceObject": reference_type,
+                "customWidth": custom_width,
+                "customHeight": custom_height,
+                "imageBytes": len(base64_image) * 3 // 4,
+                "imageHash": processor.input_hash
+            }, payload if "profile-save-input" in flags or input_data.get("profileSaveInput") else None)
         
         # Output result
         print(json.dumps(result))
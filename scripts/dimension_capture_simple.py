@@ -5,19 +5,17 @@ import numpy as np
 from PIL import Image
 import io
 import math
+from numpy_detector import detect_rectangles, measure_rectangles, detection_confidence
 
 def simple_dimension_capture(base64_image, reference_type="credit-card", custom_width=None, custom_height=None):
     """
-    Simplified version that works without YOLO/OpenCV for testing
+    Simplified version that works without YOLO/OpenCV, using the NumPy detector
     """
     try:
         # Decode base64 image
         image_data = base64.b64decode(base64_image)
         image = Image.open(io.BytesIO(image_data))
         
-        # Get image dimensions
-        img_width, img_height = image.size
-        
         # Reference object dimensions
         reference_objects = {
             "credit-card": {"name": "Credit Card", "width": 8.56, "height": 5.398},
@@ -30,20 +28,16 @@ def simple_dimension_capture(base64_image, reference_type="credit-card", custom_
         
         ref_info = reference_objects.get(reference_type, reference_objects["credit-card"])
         
-        # Mock detection - assume reference object is about 1/8 of image width
-        ref_width_px = img_width // 8
-        ref_height_px = int(ref_width_px * (ref_info["height"] / ref_info["width"]))
-        
-        # Mock target object - assume it's about 1/4 of image width
-        target_width_px = img_width // 4
-        target_height_px = int(target_width_px * 0.7)  # Assume 0.7 aspect ratio
+        # Detect rectangles and measure them against the reference
+        rectangles = detect_rectangles(image)
+        reference, targets, results, calibration_info = measure_rectangles(
+            rectangles, ref_info["width"], ref_info["height"]
+        )
         
-        # Calculate pixels per cm
-        pixels_per_cm = ref_width_px / ref_info["width"]
+        if reference is None:
+            return {"success": False, "error": calibration_info}
         
-        # Calculate target dimensions
-        target_width_cm = target_width_px / pixels_per_cm
-        target_height_cm = target_height_px / pixels_per_cm
+        main_result = max(results, key=lambda x: x["width_cm"] * x["height_cm"])
         
         # Create a simple annotated image (just return original for now)
         annotated_base64 = base64_image
@@ -52,24 +46,14 @@ def simple_dimension_capture(base64_image, reference_type="credit-card", custom_
             "success": True,
             "data": {
                 "targetDimensions": {
-                    "width": round(target_width_cm, 2),
-                    "height": round(target_height_cm, 2),
+                    "width": main_result["width_cm"],
+                    "height": main_result["height_cm"],
                     "unit": "cm"
                 },
-                "confidence": 0.75,  # Mock confidence
+                "confidence": detection_confidence(reference, ref_info["width"], ref_info["height"]),
                 "annotatedImageUrl": f"data:image/jpeg;base64,{annotated_base64}",
-                "allObjects": [{
-                    "object_id": 1,
-                    "width_cm": round(target_width_cm, 2),
-                    "height_cm": round(target_height_cm, 2),
-                    "width_px": target_width_px,
-                    "height_px": target_height_px
-                }],
-                "calibrationInfo": {
-                    "pixels_per_cm": round(pixels_per_cm, 2),
-                    "ref_width_px": ref_width_px,
-                    "ref_height_px": ref_height_px
-                }
+                "allObjects": results,
+                "calibrationInfo": calibration_info
             }
         }
         
@@ -0,0 +1,190 @@
+import json
+import os
+import platform
+import sys
+import time
+
+# Processing tiers, best quality first. detector_imgsz=None keeps the YOLO
+# default (640), analysis_max_side=None keeps full-resolution contour processing.
+PROCESSING_TIERS = [
+    {"name": "full", "detector_imgsz": None, "analysis_max_side": None, "edge_strategy": "multi_canny"},
+    {"name": "balanced", "detector_imgsz": 480, "analysis_max_side": 1600, "edge_strategy": "multi_canny"},
+    {"name": "fast", "detector_imgsz": 320, "analysis_max_side": 1024, "edge_strategy": "single_canny"},
+    {"name": "minimal", "detector_imgsz": 256, "analysis_max_side": 640, "edge_strategy": "single_canny"},
+]
+
+DEFAULT_DETECTOR_IMGSZ = 640
+
+# Priors used until a cost has been measured on this host
+PRIOR_COSTS = {
+    # ms per detector call at the default input size
+    "detector_ms": 150.0,
+    # ms per analysed megapixel for preprocess_image + find_rectangles
+    "contours_ms_per_mp": {"multi_canny": 60.0, "single_canny": 35.0},
+    # ms per full-resolution megapixel for annotate_image + encode
+    "output_ms_per_mp": 25.0
+}
+
+# Stage names timed by DimensionCapture.process_frame, grouped by cost component
+CONTOUR_STAGES = ("downscale", "preprocess_image", "find_rectangles")
+OUTPUT_STAGES = ("annotate_image", "encode")
+
+DEFAULT_PROFILE_PATH = os.environ.get(
+    "DIMENSION_CAPTURE_LATENCY_PROFILE",
+    os.path.join(os.path.expanduser("~"), ".cache", "dimension_capture", "latency_profile.json")
+)
+
+
+def analysis_megapixels(tier, width, height):
+    """Megapixels processed by the contour stages for this tier"""
+    scale = 1.0
+    if tier["analysis_max_side"]:
+        scale = min(1.0, tier["analysis_max_side"] / max(width, height))
+    return (width * scale) * (height * scale) / 1e6
+
+
+class LatencyPolicy:
+    """Picks the best processing tier whose host-measured cost fits a latency budget
+
+    A tier's cost is modelled per component, matching what each stage
+    actually scales with: the detector as a fixed cost per input size, the
+    contour stages per analysed megapixel for each edge strategy, and
+    annotation/encoding per full-resolution megapixel. Each component is
+    an exponential moving average of measured stage times, persisted per
+    host to a small JSON file so one-shot script invocations keep learning.
+    """
+
+    def __init__(self, profile_path=DEFAULT_PROFILE_PATH, tiers=PROCESSING_TIERS, smoothing=0.3,
+                 save_every=20, save_interval=60.0):
+        self.profile_path = profile_path
+        self.tiers = tiers
+        self.smoothing = smoothing
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.host = platform.node() or "unknown-host"
+        self.costs = self._load()
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+
+    def _read_profiles(self):
+        try:
+            with open(self.profile_path) as f:
+                profiles = json.load(f)
+            return profiles if isinstance(profiles, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _load(self):
+        costs = self._read_profiles().get(self.host)
+        if not isinstance(costs, dict) or "detector_ms" not in costs:
+            # Missing, or written by the older per-tier format
+            costs = {}
+        return {
+            "detector_ms": dict(costs.get("detector_ms", {})),
+            "contours_ms_per_mp": dict(costs.get("contours_ms_per_mp", {})),
+            "output_ms_per_mp": costs.get("output_ms_per_mp")
+        }
+
+    def save(self):
+        """Persist this host's measurements atomically, keeping other hosts' entries"""
+        if not self._unsaved:
+            return
+        try:
+            profiles = self._read_profiles()
+            profiles[self.host] = self.costs
+            os.makedirs(os.path.dirname(self.profile_path), exist_ok=True)
+            tmp_path = f"{self.profile_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(profiles, f, indent=2)
+            os.replace(tmp_path, self.profile_path)
+            self._unsaved = 0
+            self._last_save = time.monotonic()
+        except OSError as e:
+            print(f"Could not save latency profile: {e}", file=sys.stderr)
+
+    def detector_ms(self, imgsz):
+        """Measured detector cost for an input size, or one scaled from another size"""
+        imgsz = imgsz or DEFAULT_DETECTOR_IMGSZ
+        measured = self.costs["detector_ms"]
+        if str(imgsz) in measured:
+            return measured[str(imgsz)]
+
+        # Detector cost scales with the number of input pixels
+        if measured:
+            other = min(measured, key=lambda size: abs(int(size) - imgsz))
+            return measured[other] * (imgsz / int(other)) ** 2
+        return PRIOR_COSTS["detector_ms"] * (imgsz / DEFAULT_DETECTOR_IMGSZ) ** 2
+
+    def contours_ms_per_mp(self, edge_strategy):
+        measured = self.costs["contours_ms_per_mp"]
+        if edge_strategy in measured:
+            return measured[edge_strategy]
+
+        # Scale a measured strategy by the prior ratio
+        priors = PRIOR_COSTS["contours_ms_per_mp"]
+        for other, cost in measured.items():
+            if other in priors:
+                return cost * priors[edge_strategy] / priors[other]
+        return priors[edge_strategy]
+
+    def output_ms_per_mp(self):
+        if self.costs["output_ms_per_mp"] is not None:
+            return self.costs["output_ms_per_mp"]
+        return PRIOR_COSTS["output_ms_per_mp"]
+
+    def estimate_ms(self, tier, width, height, annotate=True):
+        estimate = (self.detector_ms(tier["detector_imgsz"]) +
+                    self.contours_ms_per_mp(tier["edge_strategy"]) * analysis_megapixels(tier, width, height))
+        if annotate:
+            estimate += self.output_ms_per_mp() * width * height / 1e6
+        return estimate
+
+    def select(self, budget_ms, width, height, annotate=True):
+        """Return (tier, estimated_ms) for a frame of the given size
+
+        Without a budget the full tier is used. If no tier fits, the
+        cheapest one is returned.
+        """
+        if budget_ms is None:
+            tier = self.tiers[0]
+            return tier, self.estimate_ms(tier, width, height, annotate)
+
+        for tier in self.tiers:
+            estimate = self.estimate_ms(tier, width, height, annotate)
+            if estimate <= budget_ms:
+                return tier, estimate
+
+        tier = self.tiers[-1]
+        return tier, self.estimate_ms(tier, width, height, annotate)
+
+    def _update(self, current, observed):
+        if current is None:
+            return observed
+        return current + self.smoothing * (observed - current)
+
+    def record(self, tier, stage_ms, width, height):
+        """Fold measured stage times (name -> ms) into the cost components
+
+        Only components whose stages all ran are updated, so cache hits
+        and skipped annotation do not distort the model.
+        """
+        if "detect_objects_yolo" in stage_ms:
+            key = str(tier["detector_imgsz"] or DEFAULT_DETECTOR_IMGSZ)
+            detector = self.costs["detector_ms"]
+            detector[key] = self._update(detector.get(key), stage_ms["detect_objects_yolo"])
+
+        megapixels = analysis_megapixels(tier, width, height)
+        if "preprocess_image" in stage_ms and "find_rectangles" in stage_ms and megapixels > 0:
+            observed = sum(stage_ms.get(name, 0.0) for name in CONTOUR_STAGES) / megapixels
+            contours = self.costs["contours_ms_per_mp"]
+            contours[tier["edge_strategy"]] = self._update(contours.get(tier["edge_strategy"]), observed)
+
+        full_megapixels = width * height / 1e6
+        if all(name in stage_ms for name in OUTPUT_STAGES) and full_megapixels > 0:
+            observed = sum(stage_ms[name] for name in OUTPUT_STAGES) / full_megapixels
+            self.costs["output_ms_per_mp"] = self._update(self.costs["output_ms_per_mp"], observed)
+
+        # Long-running workers save in batches rather than on every request
+        self._unsaved += 1
+        if self._unsaved >= self.save_every or time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
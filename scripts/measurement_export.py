@@ -0,0 +1,246 @@
+import argparse
+import base64
+import csv
+import json
+import os
+import sys
+import time
+import uuid
+
+# Column order matches public.measurements / public.measurement_objects in create_tables.sql
+MEASUREMENT_COLUMNS = [
+    "id", "user_id", "image_url", "annotated_image_url", "reference_object",
+    "custom_width", "custom_height", "target_width", "target_height",
+    "confidence", "processing_time"
+]
+MEASUREMENT_OBJECT_COLUMNS = [
+    "id", "measurement_id", "object_name", "width_cm", "height_cm",
+    "width_px", "height_px", "bbox_x", "bbox_y", "bbox_width", "bbox_height"
+]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def copy_text_value(value):
+    """Format one value for PostgreSQL COPY text format"""
+    if value is None:
+        return "\\N"
+    return (str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r"))
+
+
+class TableWriter:
+    """Streams rows for one table as COPY text or CSV"""
+
+    def __init__(self, path, columns, fmt):
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self.rows = 0
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        if fmt == "csv":
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(columns)
+
+    def write(self, row):
+        values = [row.get(column) for column in self.columns]
+        if self.fmt == "csv":
+            # Unquoted empty fields load as NULL with COPY ... CSV
+            self.csv_writer.writerow(["" if v is None else v for v in values])
+        else:
+            self.file.write("\t".join(copy_text_value(v) for v in values) + "\n")
+        self.rows += 1
+
+    def copy_command(self, table):
+        options = "(FORMAT csv, HEADER true)" if self.fmt == "csv" else "(FORMAT text)"
+        columns = ", ".join(self.columns)
+        # psql treats backslashes in quoted arguments as escapes and '' as a quote
+        path = os.path.abspath(self.path).replace("\\", "\\\\").replace("'", "''")
+        return f"\\copy {table} ({columns}) FROM '{path}' WITH {options}"
+
+    def close(self):
+        self.file.close()
+
+
+class MeasurementExporter:
+    """Streams measurement results into database-loadable files
+
+    Writes measurements and measurement_objects rows as PostgreSQL COPY
+    text (fmt="copy") or CSV (fmt="csv"), plus a JSON Lines file with the
+    raw results, and a load.sql with the matching psql \\copy commands.
+    Row ids are generated here so object rows can reference their
+    measurement without a round trip.
+    """
+
+    def __init__(self, output_dir, fmt="copy", jsonl=True, include_images=False):
+        if fmt not in ("copy", "csv"):
+            raise ValueError(f"Unsupported export format: {fmt}")
+
+        self.output_dir = output_dir
+        self.include_images = include_images
+        os.makedirs(output_dir, exist_ok=True)
+
+        extension = "csv" if fmt == "csv" else "copy"
+        self.measurements = TableWriter(
+            os.path.join(output_dir, f"measurements.{extension}"), MEASUREMENT_COLUMNS, fmt
+        )
+        self.measurement_objects = TableWriter(
+            os.path.join(output_dir, f"measurement_objects.{extension}"), MEASUREMENT_OBJECT_COLUMNS, fmt
+        )
+        self.jsonl_file = open(os.path.join(output_dir, "results.jsonl"), "w", encoding="utf-8") if jsonl else None
+        self.skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, result, metadata=None):
+        """Write one pipeline result, return the generated measurement id or None"""
+        metadata = metadata or {}
+
+        if self.jsonl_file:
+            record = {"metadata": metadata, "result": result}
+            if not self.include_images and result.get("success"):
+                record["result"] = dict(result, data={
+                    k: v for k, v in result["data"].items() if k != "annotatedImageUrl"
+                })
+            self.jsonl_file.write(json.dumps(record) + "\n")
+
+        if not result.get("success"):
+            self.skipped += 1
+            return None
+
+        data = result["data"]
+        measurement_id = str(uuid.uuid4())
+        self.measurements.write({
+            "id": measurement_id,
+            "user_id": metadata.get("userId"),
+            "image_url": metadata.get("imageUrl"),
+            "annotated_image_url": data.get("annotatedImageUrl") if self.include_images else None,
+            "reference_object": metadata.get("referenceObject", "credit-card"),
+            "custom_width": metadata.get("customWidth"),
+            "custom_height": metadata.get("customHeight"),
+            "target_width": data["targetDimensions"]["width"],
+            "target_height": data["targetDimensions"]["height"],
+            "confidence": data.get("confidence"),
+            "processing_time": metadata.get("processingTime")
+        })
+
+        for obj in data.get("allObjects", []):
+            bbox = obj.get("bbox") or (None, None, None, None)
+            self.measurement_objects.write({
+                "id": str(uuid.uuid4()),
+                "measurement_id": measurement_id,
+                "object_name": f"Object {obj.get('object_id', 1)}",
+                "width_cm": obj["width_cm"],
+                "height_cm": obj["height_cm"],
+                "width_px": obj.get("width_px"),
+                "height_px": obj.get("height_px"),
+                "bbox_x": bbox[0],
+                "bbox_y": bbox[1],
+                "bbox_width": bbox[2],
+                "bbox_height": bbox[3]
+            })
+
+        return measurement_id
+
+    def close(self):
+        """Close all files and write load.sql"""
+        self.measurements.close()
+        self.measurement_objects.close()
+        if self.jsonl_file:
+            self.jsonl_file.close()
+
+        with open(os.path.join(self.output_dir, "load.sql"), "w") as f:
+            f.write("BEGIN;\n")
+            f.write(self.measurements.copy_command("public.measurements") + "\n")
+            f.write(self.measurement_objects.copy_command("public.measurement_objects") + "\n")
+            f.write("COMMIT;\n")
+
+        print(f"📦 Exported {self.measurements.rows} measurements and "
+              f"{self.measurement_objects.rows} objects to {self.output_dir} "
+              f"({self.skipped} failed results skipped)", file=sys.stderr)
+
+
+def iter_image_paths(paths):
+    """Expand files and directories into image file paths"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def load_engine(name):
+    """Create the processor for the requested engine"""
+    if name == "full":
+        from dimension_capture import DimensionCapture
+        return DimensionCapture()
+    from dimension_capture_headless import HeadlessDimensionCapture
+    return HeadlessDimensionCapture()
+
+
+def measure_image_file(processor, image_path, reference_object, custom_width=None, custom_height=None, annotate=True):
+    """Measure one image file
+
+    The full engine decodes the file straight into a frame for
+    process_frame, skipping the base64 round trip; other engines (and the
+    full engine's fallback mode) go through process_image_from_base64.
+    """
+    if hasattr(processor, "process_frame") and getattr(processor, "model", None) is not None:
+        import cv2
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            return {"success": False, "error": "Could not decode image"}
+        return processor.process_frame(image, reference_object, custom_width, custom_height, annotate=annotate)
+
+    with open(image_path, "rb") as f:
+        base64_image = base64.b64encode(f.read()).decode("utf-8")
+    return processor.process_image_from_base64(base64_image, reference_object, custom_width, custom_height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure images in bulk and export database-loadable files")
+    parser.add_argument("images", nargs="+", help="Image files or directories")
+    parser.add_argument("--output-dir", default="export", help="Directory for exported files")
+    parser.add_argument("--format", choices=["copy", "csv"], default="copy", help="Row file format")
+    parser.add_argument("--engine", choices=["full", "headless"], default="full", help="Processing engine")
+    parser.add_argument("--reference-object", default="credit-card")
+    parser.add_argument("--custom-width", type=float)
+    parser.add_argument("--custom-height", type=float)
+    parser.add_argument("--user-id", help="user_id to attach to every measurement")
+    parser.add_argument("--include-images", action="store_true", help="Store annotated images as data URLs")
+    parser.add_argument("--no-jsonl", action="store_true", help="Skip results.jsonl")
+    args = parser.parse_args()
+
+    processor = load_engine(args.engine)
+
+    with MeasurementExporter(args.output_dir, args.format, not args.no_jsonl, args.include_images) as exporter:
+        for image_path in iter_image_paths(args.images):
+            start = time.perf_counter()
+            # Annotated images are only rendered when they are exported
+            result = measure_image_file(
+                processor, image_path, args.reference_object, args.custom_width, args.custom_height,
+                annotate=args.include_images
+            )
+            processing_time = int((time.perf_counter() - start) * 1000)
+
+            exporter.write(result, {
+                "userId": args.user_id,
+                "imageUrl": image_path,
+                "referenceObject": args.reference_object,
+                "customWidth": args.custom_width,
+                "customHeight": args.custom_height,
+                "processingTime": processing_time
+            })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+# Objects are found on a grayscale copy whose longest side is at most this;
+# box sides are then refined on full-resolution strips (see refine_box)
+ANALYSIS_MAX_SIDE = 400
+
+
+def otsu_threshold(values):
+    """Otsu threshold of a float array with values in [0, 255]"""
+    hist, _ = np.histogram(values, bins=256, range=(0, 256))
+    hist = hist.astype(np.float64)
+    bins = np.arange(256, dtype=np.float64)
+
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * bins)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+
+    between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    return float(np.argmax(between))
+
+
+def edge_map(gray):
+    """Binary edge map from central-difference gradients of a smoothed image
+
+    Uses Canny-style hysteresis: pixels above the Otsu threshold are
+    strong edges, and weaker pixels above half of it are kept when they
+    are connected to a strong one.
+    """
+    # 3x3 box blur via shifted sums
+    padded = np.pad(gray, 1, mode="edge")
+    h, w = gray.shape
+    blurred = sum(padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)) / 9.0
+
+    gx = np.zeros_like(blurred)
+    gy = np.zeros_like(blurred)
+    gx[:, 1:-1] = blurred[:, 2:] - blurred[:, :-2]
+    gy[1:-1, :] = blurred[2:, :] - blurred[:-2, :]
+    magnitude = np.minimum(np.abs(gx) + np.abs(gy), 255)
+
+    # Otsu on the gradient separates real edges from texture; the floor
+    # keeps flat images from turning noise into edges
+    high = max(otsu_threshold(magnitude), 12.0)
+    edges = hysteresis(magnitude > high / 2, magnitude > high)
+
+    # One 3x3 dilation closes small gaps in object outlines
+    padded = np.pad(edges, 1)
+    dilated = np.zeros_like(edges)
+    for dy in range(3):
+        for dx in range(3):
+            dilated |= padded[dy:dy + h, dx:dx + w]
+    return dilated
+
+
+def find_runs(mask):
+    """Horizontal runs of True pixels as (rows, starts, ends) with exclusive ends"""
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(diff == 1)
+    _, ends = np.nonzero(diff == -1)
+    return rows, starts, ends
+
+
+def label_runs(rows, starts, ends, width):
+    """8-connected component label for every run"""
+    n = len(rows)
+    labels = np.arange(n)
+    if n == 0:
+        return labels
+
+    # Runs touching run i lie in row + 1 and form a contiguous index range
+    # (runs are sorted by row, then column), so two searchsorted calls
+    # find every neighbouring pair at once
+    stride = width + 2
+    start_keys = rows * stride + starts
+    end_keys = rows * stride + ends
+    lo = np.searchsorted(end_keys, (rows + 1) * stride + starts, side="left")
+    hi = np.searchsorted(start_keys, (rows + 1) * stride + ends, side="right")
+    counts = np.maximum(hi - lo, 0)
+
+    a = np.repeat(np.arange(n), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    b = np.repeat(lo, counts) + offsets
+
+    # Min-label propagation with pointer jumping until stable
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, a, low)
+        np.minimum.at(new_labels, b, low)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def hysteresis(weak, strong):
+    """Keep connected regions of weak that contain at least one strong pixel"""
+    h, w = weak.shape
+    rows, starts, ends = find_runs(weak)
+    if len(rows) == 0:
+        return weak
+    labels = label_runs(rows, starts, ends, w)
+
+    # Strong pixels per run from row-wise prefix sums
+    prefix = np.zeros((h, w + 1), dtype=np.int32)
+    np.cumsum(strong, axis=1, out=prefix[:, 1:])
+    has_strong = prefix[rows, ends] > prefix[rows, starts]
+
+    keep = np.zeros(len(labels), dtype=bool)
+    keep[labels[has_strong]] = True
+    return paint_runs(weak.shape, rows, starts, ends, keep[labels].astype(np.int64)) == 1
+
+
+def paint_runs(shape, rows, starts, ends, values):
+    """Label image with each run's pixels set to its value"""
+    h, w = shape
+    lengths = ends - starts
+    image = np.full(h * w, -1, dtype=np.int64)
+    first = rows * w + starts
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    image[np.repeat(first, lengths) + offsets] = np.repeat(values, lengths)
+    return image.reshape(h, w)
+
+
+def fill_holes(mask):
+    """Fill regions not connected to the image border"""
+    h, w = mask.shape
+    rows, starts, ends = find_runs(~mask)
+    labels = label_runs(rows, starts, ends, w)
+
+    touches_border = (rows == 0) | (rows == h - 1) | (starts == 0) | (ends == w)
+    outside_labels = np.unique(labels[touches_border])
+    is_outside = np.isin(labels, outside_labels)
+
+    outside = paint_runs(mask.shape, rows, starts, ends, is_outside.astype(np.int64)) == 1
+    return ~outside
+
+
+def connected_boxes(mask, marked=None):
+    """Bounding box and pixel count of every 8-connected component
+
+    If marked is given, also counts the marked pixels inside each component.
+    """
+    h, w = mask.shape
+    rows, starts, ends = find_runs(mask)
+    if len(rows) == 0:
+        return []
+    labels = label_runs(rows, starts, ends, w)
+    _, component = np.unique(labels, return_inverse=True)
+    count = component.max() + 1
+
+    x0 = np.full(count, w)
+    y0 = np.full(count, h)
+    x1 = np.zeros(count, dtype=np.int64)
+    y1 = np.zeros(count, dtype=np.int64)
+    pixels = np.zeros(count, dtype=np.int64)
+    np.minimum.at(x0, component, starts)
+    np.minimum.at(y0, component, rows)
+    np.maximum.at(x1, component, ends)
+    np.maximum.at(y1, component, rows + 1)
+    np.add.at(pixels, component, ends - starts)
+
+    marked_pixels = np.zeros(count, dtype=np.int64)
+    if marked is not None:
+        prefix = np.zeros((h, w + 1), dtype=np.int32)
+        np.cumsum(marked, axis=1, out=prefix[:, 1:])
+        np.add.at(marked_pixels, component, prefix[rows, ends] - prefix[rows, starts])
+
+    return [
+        {
+            "bbox": (int(x0[i]), int(y0[i]), int(x1[i] - x0[i]), int(y1[i] - y0[i])),
+            "pixels": int(pixels[i]),
+            "marked_pixels": int(marked_pixels[i])
+        }
+        for i in range(count)
+    ]
+
+
+def edge_position(strip, axis, coarse, offset, smoothing=1):
+    """Position of the strongest step across a grayscale strip
+
+    The strip is averaged along the edge (axis) and its differences are
+    smoothed with a triangular kernel of the given half-width, which
+    suppresses noise on blurred edges but keeps a single peak on sharp
+    ones. The result is the pixel boundary with the largest intensity
+    change, in image coordinates (offset is the strip's first
+    coordinate), or coarse when the strip has no clear step.
+    """
+    profile = np.asarray(strip, dtype=np.float32).mean(axis=axis)
+    if len(profile) < 2:
+        return coarse
+    kernel = np.concatenate([np.arange(1, smoothing + 1), np.arange(smoothing - 1, 0, -1)])
+    steps = np.abs(np.convolve(np.diff(profile), kernel / kernel.sum(), mode="same"))
+    # Below a grey level the step is noise, not an edge
+    if steps.max() < 1.0:
+        return coarse
+    return offset + int(np.argmax(steps)) + 1
+
+
+def gray_crop(image, box):
+    """Grayscale crop (x0, y0, x1, y1) of a PIL image or a NumPy frame"""
+    if isinstance(image, np.ndarray):
+        x0, y0, x1, y1 = box
+        strip = image[y0:y1, x0:x1]
+        return strip.mean(axis=2) if strip.ndim == 3 else strip
+    return image.crop(box).convert("L")
+
+
+def refine_box(image, bbox, radius, smoothing=1):
+    """Snap each side of a coarse full-resolution box to the image edge
+
+    Looks for the strongest step within radius pixels of every side,
+    using a strip over the middle half of that side so corners and
+    neighbouring objects do not interfere. Only these strips are read at
+    full resolution. image is a PIL image or a NumPy frame.
+    """
+    if isinstance(image, np.ndarray):
+        img_height, img_width = image.shape[:2]
+    else:
+        img_width, img_height = image.size
+    x0, y0, w, h = bbox
+    x1, y1 = x0 + w, y0 + h
+    # Keep the windows of opposite sides apart on small boxes
+    rx = max(1, min(radius, w // 3))
+    ry = max(1, min(radius, h // 3))
+    span_y = (y0 + h // 4, max(y0 + 3 * h // 4, y0 + h // 4 + 1))
+    span_x = (x0 + w // 4, max(x0 + 3 * w // 4, x0 + w // 4 + 1))
+
+    def vertical_edge(x):
+        lo, hi = max(0, x - rx), min(img_width, x + rx)
+        if hi - lo < 2:
+            return x
+        return edge_position(gray_crop(image, (lo, span_y[0], hi, span_y[1])), 0, x, lo, smoothing)
+
+    def horizontal_edge(y):
+        lo, hi = max(0, y - ry), min(img_height, y + ry)
+        if hi - lo < 2:
+            return y
+        return edge_position(gray_crop(image, (span_x[0], lo, span_x[1], hi)), 1, y, lo, smoothing)
+
+    x0, x1 = vertical_edge(x0), vertical_edge(x1)
+    y0, y1 = horizontal_edge(y0), horizontal_edge(y1)
+    if x1 <= x0 or y1 <= y0:
+        return bbox
+    return (x0, y0, x1 - x0, y1 - y0)
+
+
+def detect_rectangles(image, max_side=ANALYSIS_MAX_SIDE, min_area_fraction=0.002, min_rectangularity=0.6):
+    """Detect rectangular objects in a PIL image using only NumPy
+
+    Objects are found on a copy downscaled to max_side, then each side of
+    every box is refined on full-resolution strips, so the measured size
+    is accurate to about a pixel of the original image rather than a
+    pixel of the analysis copy. Returns rectangles in full-resolution
+    pixel coordinates with the same keys the OpenCV engine uses (bbox,
+    area, aspect_ratio, center, rectangularity), largest first.
+    """
+    img_width, img_height = image.size
+    if img_width == 0 or img_height == 0:
+        return []
+    # reduce() does not support palette and other modes; L is also
+    # what every later step reads
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("L")
+
+    scale = min(1.0, max_side / max(img_width, img_height))
+    small_size = (max(1, round(img_width * scale)), max(1, round(img_height * scale)))
+
+    # An integer box reduce first keeps the resize cheap on large photos
+    factor_int = int(1.0 / scale)
+    small = image.reduce(factor_int) if factor_int > 1 else image
+    gray = small.convert("L")
+    if gray.size != small_size:
+        gray = gray.resize(small_size, Image.BILINEAR)
+    gray = np.asarray(gray, dtype=np.float32)
+
+    edges = edge_map(gray)
+    objects = fill_holes(edges)
+
+    small_area = gray.shape[0] * gray.shape[1]
+    factor = 1.0 / scale
+    # Search a couple of analysis pixels either side of each coarse edge
+    radius = int(math.ceil(2 * factor)) + 1
+    smoothing = max(1, int(factor // 2))
+    rectangles = []
+    for component in connected_boxes(objects, marked=edges):
+        x, y, w, h = component["bbox"]
+        box_area = w * h
+        # Skip specks and anything spanning (almost) the whole frame
+        if box_area < min_area_fraction * small_area or box_area > 0.9 * small_area:
+            continue
+
+        rectangularity = component["pixels"] / box_area
+        if rectangularity < min_rectangularity:
+            continue
+
+        # The outline band is centred on the true edge, so shrink the box
+        # by half the band thickness (edge pixels / outline length)
+        thickness = component["marked_pixels"] / (2 * (w + h))
+        thickness = component["marked_pixels"] / max(2 * (w + h) - 4 * thickness, 1)
+        inset = min(thickness / 2, (min(w, h) - 1) / 2)
+
+        x, y = int(round((x + inset) * factor)), int(round((y + inset) * factor))
+        w, h = int(round((w - 2 * inset) * factor)), int(round((h - 2 * inset) * factor))
+        x, y, w, h = refine_box(image, (x, y, w, h), radius, smoothing)
+        rectangles.append({
+            "bbox": (x, y, w, h),
+            "area": component["pixels"] * factor * factor,
+            "aspect_ratio": w / h if h > 0 else 0,
+            "center": (x + w // 2, y + h // 2),
+            "rectangularity": round(rectangularity, 3)
+        })
+
+    rectangles.sort(key=lambda r: r["area"], reverse=True)
+    return rectangles
+
+
+def measure_rectangles(rectangles, ref_width_cm, ref_height_cm, aspect_tolerance=0.25):
+    """Pick the reference among detected rectangles and measure the rest
+
+    Returns (reference, targets, results, calibration_info), or
+    (None, None, None, error_message) when nothing can be measured.
+    Aspect ratios are compared orientation-free (long side / short side).
+    """
+    if len(rectangles) < 2:
+        if not rectangles:
+            return None, None, None, "No rectangular objects detected!"
+        return None, None, None, "Reference object not detected!"
+
+    expected_aspect = max(ref_width_cm, ref_height_cm) / min(ref_width_cm, ref_height_cm)
+
+    def aspect_error(rect):
+        w, h = rect["bbox"][2], rect["bbox"][3]
+        aspect = max(w, h) / max(min(w, h), 1)
+        return abs(math.log(aspect / expected_aspect))
+
+    # The largest rectangle is the target in every supported setup, so the
+    # reference is the best aspect match among the rest
+    candidates = [r for r in rectangles[1:] if aspect_error(r) <= math.log(1 + aspect_tolerance)]
+    if candidates:
+        reference = min(candidates, key=aspect_error)
+    else:
+        # Fallback mirrors the OpenCV engine: smallest rectangle if clearly smaller
+        reference = rectangles[-1]
+        if reference["area"] >= rectangles[0]["area"] * 0.8:
+            return None, None, None, "Reference object not detected!"
+
+    targets = [r for r in rectangles if r is not reference]
+
+    ref_w, ref_h = reference["bbox"][2], reference["bbox"][3]
+    pixels_per_cm = (max(ref_w, ref_h) / max(ref_width_cm, ref_height_cm) +
+                     min(ref_w, ref_h) / min(ref_width_cm, ref_height_cm)) / 2
+
+    results = []
+    for i, obj in enumerate(targets):
+        w, h = obj["bbox"][2], obj["bbox"][3]
+        results.append({
+            "object_id": i + 1,
+            "width_cm": round(w / pixels_per_cm, 2),
+            "height_cm": round(h / pixels_per_cm, 2),
+            "width_px": w,
+            "height_px": h,
+            "bbox": obj["bbox"]
+        })
+
+    calibration_info = {
+        "pixels_per_cm": round(pixels_per_cm, 2),
+        "ref_width_px": ref_w,
+        "ref_height_px": ref_h
+    }
+    return reference, targets, results, calibration_info
+
+
+def detection_confidence(reference, ref_width_cm, ref_height_cm):
+    """Confidence from how rectangular the reference is and how well its aspect matches"""
+    w, h = reference["bbox"][2], reference["bbox"][3]
+    expected = max(ref_width_cm, ref_height_cm) / min(ref_width_cm, ref_height_cm)
+    aspect = max(w, h) / max(min(w, h), 1)
+    aspect_match = max(0.0, 1 - abs(aspect - expected) / expected)
+    return round(min(0.85, 0.4 + 0.45 * reference["rectangularity"] * aspect_match), 2)
@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class RequestProfiler:
+    """Sampling CPU profiler plus per-stage tracemalloc peaks for a single request"""
+
+    def __init__(self, output_dir="profiles", interval=0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.stack_counts = {}
+        self.stages = []
+        self._target_thread_id = None
+        self._sampler = None
+        self._running = threading.Event()
+        self._started_at = None
+        self._elapsed = 0.0
+        self._started_tracing = False
+
+    def start(self):
+        """Start sampling the calling thread and tracing allocations"""
+        self._target_thread_id = threading.get_ident()
+        # Leave tracing alone at stop() if someone else turned it on
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        self._running.set()
+        self._started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling and allocation tracing"""
+        self._running.clear()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self._elapsed = time.perf_counter() - self._started_at
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _sample_loop(self):
+        while self._running.is_set():
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Collapsed stacks are root-first
+                key = ";".join(reversed(stack))
+                self.stack_counts[key] = self.stack_counts.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    @contextmanager
+    def stage(self, name):
+        """Record wall time and peak traced memory for one pipeline stage"""
+        tracemalloc.reset_peak()
+        current_before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            current_after, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                "stage": name,
+                "time_ms": round(elapsed_ms, 2),
+                "peak_memory_bytes": max(peak - current_before, 0),
+                "retained_memory_bytes": current_after - current_before
+            })
+
+    def write(self, request_info=None, payload=None):
+        """Write the collapsed-stack file and memory report, return their paths
+
+        If payload (the raw request JSON) is given it is saved next to the
+        report so the exact request can be replayed.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_name = f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        collapsed_path = os.path.join(self.output_dir, base_name + ".collapsed")
+        report_path = os.path.join(self.output_dir, base_name + ".json")
+        payload_path = None
+
+        if payload is not None:
+            payload_path = os.path.join(self.output_dir, base_name + ".request.json")
+            with open(payload_path, "w") as f:
+                f.write(payload)
+
+        with open(collapsed_path, "w") as f:
+            for stack, count in sorted(self.stack_counts.items()):
+                f.write(f"{stack} {count}\n")
+
+        report = {
+            "total_time_ms": round(self._elapsed * 1000, 2),
+            "sample_interval_ms": self.interval * 1000,
+            "samples": sum(self.stack_counts.values()),
+            "stages": self.stages,
+            "request": request_info or {},
+            "payload": payload_path
+        }
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"📈 Profile written to {collapsed_path} and {report_path}", file=sys.stderr)
+
+        return {
+            "collapsedStacks": collapsed_path,
+            "report": report_path,
+            "payload": payload_path,
+            "stages": self.stages
+        }
+
+
+@contextmanager
+def null_stage(name):
+    """Stage hook used when profiling is disabled"""
+    yield
+
+
+def parse_cli_args(argv):
+    """Split the JSON payload from CLI flags such as --profile and --stream
+
+    Returns (payload, flags) where flags holds the flag names without dashes.
+    """
+    flags = set()
+    payload = None
+    for arg in argv[1:]:
+        if arg.startswith("--"):
+            flags.add(arg[2:])
+        elif payload is None:
+            payload = arg
+    return payload, flags
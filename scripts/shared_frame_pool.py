@@ -0,0 +1,198 @@
+import multiprocessing as mp
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _frame_worker(shm_name, slot_size, task_queue, result_queue):
+    """Worker loop: wrap frames in shared memory as NumPy arrays and measure them
+
+    If the engine cannot be set up, the worker keeps answering every task
+    with an error result so the producer never waits on it.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    try:
+        init_error = None
+        try:
+            # Imported here so the producer does not pay the OpenCV/YOLO import cost
+            from dimension_capture import DimensionCapture
+            dc = DimensionCapture()
+            if dc.model is None:
+                init_error = "Full pipeline unavailable in worker"
+        except Exception as e:
+            init_error = f"Worker initialisation failed: {e}"
+            print(init_error, file=sys.stderr)
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                if not init_error:
+                    dc.latency_policy.save()
+                break
+
+            request_id, slot, shape, dtype, params = task
+            if init_error:
+                result = {"success": False, "error": init_error}
+            else:
+                # Zero-copy view onto the producer's frame
+                frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=slot * slot_size)
+                try:
+                    result = dc.process_frame(
+                        frame,
+                        params.get("referenceObject", "credit-card"),
+                        params.get("customWidth"),
+                        params.get("customHeight"),
+                        annotate=params.get("annotate", False),
+                        latency_budget_ms=params.get("latencyBudgetMs"),
+                        cache_key=params.get("cacheKey")
+                    )
+                finally:
+                    # Drop the view before the buffer can be closed
+                    del frame
+
+            result_queue.put((request_id, slot, result))
+    finally:
+        shm.close()
+
+
+class SharedFramePool:
+    """Pool of DimensionCapture workers fed through a shared-memory ring of frame slots
+
+    The producer writes decoded frames into fixed-size slots of one
+    SharedMemory block and sends only (slot, shape, dtype) to a worker,
+    which wraps the slot as a NumPy array without copying and returns the
+    measurement JSON. Use reserve() to decode or capture straight into a
+    slot and avoid even the producer-side copy.
+    """
+
+    def __init__(self, num_workers=2, num_slots=4, max_frame_shape=(2160, 3840, 3)):
+        if num_slots < num_workers:
+            raise ValueError("num_slots must be at least num_workers")
+
+        self.slot_size = int(np.prod(max_frame_shape)) * np.dtype(np.uint8).itemsize
+        self.num_slots = num_slots
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_size * num_slots)
+
+        ctx = mp.get_context("spawn")
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        self.workers = [
+            ctx.Process(
+                target=_frame_worker,
+                args=(self.shm.name, self.slot_size, self.task_queue, self.result_queue),
+                daemon=True
+            )
+            for _ in range(num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        self.free_slots = list(range(num_slots))
+        self.completed = {}
+        self.next_request_id = 0
+        self.closed = False
+
+        print(f"Started {num_workers} frame workers with {num_slots} shared slots "
+              f"({self.slot_size // (1024 * 1024)} MB each)", file=sys.stderr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _slot_view(self, slot, shape, dtype=np.uint8):
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_size)
+
+    def _collect_one(self, timeout=None, poll_interval=0.5):
+        """Move one finished result into self.completed and free its slot
+
+        Polls so a crashed worker is noticed: a dead worker may have taken a
+        frame with it, so RuntimeError is raised rather than waiting for a
+        result that will never come. queue.Empty is raised after timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = poll_interval
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0))
+            try:
+                request_id, slot, result = self.result_queue.get(timeout=wait)
+                break
+            except queue.Empty:
+                dead = [w for w in self.workers if not w.is_alive()]
+                if dead:
+                    codes = ", ".join(str(w.exitcode) for w in dead)
+                    raise RuntimeError(f"{len(dead)} of {len(self.workers)} frame workers exited (exit codes: {codes})")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+        self.free_slots.append(slot)
+        self.completed[request_id] = result
+
+    def reserve(self, shape, dtype=np.uint8):
+        """Return (slot, writable array) backed by shared memory, waiting for a free slot"""
+        if int(np.prod(shape)) * np.dtype(dtype).itemsize > self.slot_size:
+            raise ValueError(f"Frame of shape {shape} does not fit in a {self.slot_size}-byte slot")
+
+        while not self.free_slots:
+            self._collect_one()
+        slot = self.free_slots.pop(0)
+        return slot, self._slot_view(slot, shape, dtype)
+
+    def submit_reserved(self, slot, frame, reference_type="credit-card", custom_width=None, custom_height=None, annotate=False, latency_budget_ms=None, cache_key=None):
+        """Queue a frame already written into a reserved slot, return its request id
+
+        Pass cache_key (e.g. a hash of the encoded image) to let the worker
+        reuse cached stages for repeated images; frames are never hashed.
+        """
+        request_id = self.next_request_id
+        self.next_request_id += 1
+
+        params = {
+            "referenceObject": reference_type,
+            "customWidth": custom_width,
+            "customHeight": custom_height,
+            "annotate": annotate,
+            "latencyBudgetMs": latency_budget_ms,
+            "cacheKey": cache_key
+        }
+        self.task_queue.put((request_id, slot, frame.shape, frame.dtype.str, params))
+        return request_id
+
+    def submit(self, frame, reference_type="credit-card", custom_width=None, custom_height=None, annotate=False, latency_budget_ms=None, cache_key=None):
+        """Copy a frame into a free slot and queue it, return its request id"""
+        slot, view = self.reserve(frame.shape, frame.dtype)
+        np.copyto(view, frame)
+        return self.submit_reserved(slot, view, reference_type, custom_width, custom_height, annotate, latency_budget_ms, cache_key)
+
+    def result(self, request_id, timeout=None):
+        """Wait for and return the result of one request"""
+        while request_id not in self.completed:
+            self._collect_one(timeout)
+        return self.completed.pop(request_id)
+
+    def measure(self, frame, reference_type="credit-card", custom_width=None, custom_height=None, annotate=False, latency_budget_ms=None, cache_key=None):
+        """Submit a frame and wait for its result"""
+        request_id = self.submit(frame, reference_type, custom_width, custom_height, annotate, latency_budget_ms, cache_key)
+        return self.result(request_id)
+
+    def close(self):
+        """Stop workers and release the shared memory block"""
+        if self.closed:
+            return
+        self.closed = True
+
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get("DIMENSION_CAPTURE_STAGE_CACHE_DIR")
+
+
+def content_hash(data):
+    """Hash image bytes or a NumPy frame into a cache key"""
+    digest = hashlib.blake2b(digest_size=16)
+    if hasattr(data, "shape"):
+        # Include the shape so equal bytes with different layouts differ
+        digest.update(str((data.shape, data.dtype.str)).encode())
+        data = data.data if data.flags.c_contiguous else data.tobytes()
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def _json_default(value):
+    # NumPy scalars from OpenCV/YOLO results
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_stages(value):
+    """Flatten (detections, rectangles) into plain arrays for np.savez
+
+    Everything except the contours is stored as JSON, so loading never
+    needs pickle.
+    """
+    detections, rectangles = value
+    meta = {
+        "detections": detections,
+        "rectangles": [{k: v for k, v in rect.items() if k != "contour"} for rect in rectangles]
+    }
+    arrays = {"meta": np.frombuffer(json.dumps(meta, default=_json_default).encode(), dtype=np.uint8)}
+    for i, rect in enumerate(rectangles):
+        if "contour" in rect:
+            arrays[f"contour_{i}"] = np.asarray(rect["contour"])
+    return arrays
+
+
+def decode_stages(arrays):
+    """Inverse of encode_stages"""
+    meta = json.loads(arrays["meta"].tobytes().decode())
+    detections = meta["detections"]
+    rectangles = meta["rectangles"]
+    for item in detections + rectangles:
+        for key in ("bbox", "center"):
+            if key in item:
+                item[key] = tuple(item[key])
+    for i, rect in enumerate(rectangles):
+        if f"contour_{i}" in arrays:
+            rect["contour"] = arrays[f"contour_{i}"]
+    return detections, rectangles
+
+
+class StageCache:
+    """Bounded LRU cache for parameter-independent pipeline stages
+
+    Stores the detector output and rectangle candidates for an image so a
+    re-submission with a different reference object or custom size only
+    re-runs classification and measurement. Entries live in memory; when
+    cache_dir is set (or DIMENSION_CAPTURE_STAGE_CACHE_DIR) they are also
+    written to disk as .npz files (JSON metadata plus contour arrays, no
+    pickle) so one-shot CLI invocations share the cache, with the same
+    max_entries bound enforced by file modification time. An unreadable
+    disk entry is deleted and counts as a miss.
+    """
+
+    def __init__(self, max_entries=32, cache_dir=DEFAULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Return the cached stages for key or None"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.cache_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                try:
+                    with np.load(path, allow_pickle=False) as arrays:
+                        value = decode_stages(arrays)
+                    os.utime(path)  # Mark as recently used
+                    self._remember(key, value)
+                    self.hits += 1
+                    return value
+                except Exception as e:
+                    # A corrupt or foreign entry must never fail the request
+                    print(f"Discarding unreadable stage cache entry {path}: {e}", file=sys.stderr)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Store stages for key, evicting the least recently used entries"""
+        self._remember(key, value)
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **encode_stages(value))
+                os.replace(tmp_path, self._path(key))
+                self._evict_disk()
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Stage cache write failed: {e}", file=sys.stderr)
+
+    def _remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _evict_disk(self):
+        files = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir) if name.endswith(".npz")
+        ]
+        if len(files) <= self.max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from numpy_detector import detect_rectangles, fill_holes, find_runs, label_runs, measure_rectangles
+
+
+def make_scene(size=(4000, 3000), pixels_per_cm=15, mode="RGB"):
+    """Credit card and a 20 x 15 cm target on a plain background"""
+    image = Image.new("RGB", size, (200, 195, 190))
+    draw = ImageDraw.Draw(image)
+    card = (600, 600, round(8.56 * pixels_per_cm), round(5.398 * pixels_per_cm))
+    target = (2000, 1400, round(20 * pixels_per_cm), round(15 * pixels_per_cm))
+    for (x, y, w, h), color in ((card, (30, 60, 140)), (target, (90, 50, 40))):
+        draw.rectangle([x, y, x + w - 1, y + h - 1], fill=color)
+    return image.convert(mode), card, target
+
+
+def test_label_runs_groups_diagonal_neighbours():
+    mask = np.array([
+        [1, 1, 0, 0, 0],
+        [0, 0, 1, 0, 0],
+        [0, 0, 0, 0, 1],
+        [0, 0, 0, 1, 1],
+    ], dtype=bool)
+    rows, starts, ends = find_runs(mask)
+    labels = label_runs(rows, starts, ends, mask.shape[1])
+
+    # Runs: (0,0-2), (1,2-3), (2,4-5), (3,3-5)
+    assert labels[0] == labels[1]
+    assert labels[2] == labels[3]
+    assert labels[0] != labels[2]
+
+
+def test_label_runs_empty():
+    empty = np.array([], dtype=np.int64)
+    assert len(label_runs(empty, empty, empty, 10)) == 0
+
+
+def test_fill_holes_fills_enclosed_region_only():
+    mask = np.zeros((7, 9), dtype=bool)
+    mask[1:6, 1:6] = True
+    mask[2:5, 2:5] = False  # Enclosed hole
+    mask[3, 6:] = True
+
+    filled = fill_holes(mask)
+
+    assert filled[1:6, 1:6].all()
+    assert not filled[0].any()
+    assert not filled[6].any()
+    assert filled[3, 6:].all()
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L", "P", "LA", "RGBA"])
+def test_detect_rectangles_measures_small_reference_accurately(mode):
+    image, card, target = make_scene(mode=mode)
+
+    rectangles = detect_rectangles(image)
+    assert [r["bbox"] for r in rectangles] == [target, card]
+
+    _, _, results, calibration = measure_rectangles(rectangles, 8.56, 5.398)
+    assert calibration["pixels_per_cm"] == pytest.approx(15, rel=0.01)
+    assert results[0]["width_cm"] == pytest.approx(20, rel=0.01)
+    assert results[0]["height_cm"] == pytest.approx(15, rel=0.01)
+
+
+@pytest.mark.parametrize("size", [(640, 480), (0, 0)])
+def test_detect_rectangles_empty_image(size):
+    assert detect_rectangles(Image.new("P", size)) == []
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+dimension_capture = pytest.importorskip("dimension_capture")
+
+from latency_policy import PROCESSING_TIERS, LatencyPolicy
+from stage_cache import StageCache
+
+
+class NoModel:
+    """Stands in for YOLO so the test needs no weights"""
+
+    def __init__(self, *args, **kwargs):
+        self.names = {}
+
+
+def make_frame(size=(4000, 3000), pixels_per_cm=40):
+    """BGR frame with a credit card and a 20 x 15 cm target"""
+    rng = np.random.default_rng(0)
+    frame = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    frame[:] = (190, 195, 200)
+    for (x, y, w_cm, h_cm), color in (((600, 600, 8.56, 5.398), (140, 60, 30)),
+                                      ((2000, 1200, 20, 15), (40, 50, 90))):
+        w, h = round(w_cm * pixels_per_cm), round(h_cm * pixels_per_cm)
+        frame[y:y + h, x:x + w] = color
+    # Slight lens blur and sensor noise, as in a camera frame
+    frame = cv2.GaussianBlur(frame, (0, 0), 1.5)
+    noise = rng.normal(0, 2, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope="module")
+def capture(tmp_path_factory):
+    original = dimension_capture.YOLO
+    dimension_capture.YOLO = NoModel
+    try:
+        dc = dimension_capture.DimensionCapture()
+    finally:
+        dimension_capture.YOLO = original
+    dc.detect_objects_yolo = lambda image, imgsz=None: []
+    dc.stage_cache = StageCache(cache_dir=None)
+    dc.profile_path = str(tmp_path_factory.mktemp("latency") / "profile.json")
+    return dc
+
+
+@pytest.mark.parametrize("pixels_per_cm", [15, 40])
+@pytest.mark.parametrize("tier", PROCESSING_TIERS, ids=lambda tier: tier["name"])
+def test_tiers_agree_on_synthetic_scene(capture, tier, pixels_per_cm):
+    capture.latency_policy = LatencyPolicy(profile_path=capture.profile_path, tiers=[tier])
+
+    result = capture.process_frame(make_frame(pixels_per_cm=pixels_per_cm), annotate=False)
+
+    assert result["success"], result.get("error")
+    assert result["data"]["processingTier"]["name"] == tier["name"]
+    dimensions = result["data"]["targetDimensions"]
+    assert dimensions["width"] == pytest.approx(20, rel=0.015)
+    assert dimensions["height"] == pytest.approx(15, rel=0.015)